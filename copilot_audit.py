@@ -20,24 +20,62 @@ Usage:
 
 import os
 import sys
+import atexit
 import csv
 import logging
 import argparse
+import re
+import asyncio
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 # Third-party imports
 try:
-    from msal import ConfidentialClientApplication
+    from msal import ConfidentialClientApplication, SerializableTokenCache
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
     from dotenv import load_dotenv
 except ImportError as e:
     print(f"Missing required package: {e}")
     print("Please install requirements: pip install -r requirements.txt")
     sys.exit(1)
 
+# Optional HTTP/2 async client for blob downloads (falls back to a thread pool)
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# HTTP/2 in httpx needs the h2 package (httpx[http2]); use HTTP/1.1 without it
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Optional faster event loop (not available on Windows)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Optional faster JSON decoding
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional fast ISO 8601 timestamp parsing
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -49,6 +87,117 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Month abbreviations for the dd-MMM-yyyy CSV timestamp format
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# Characters a userPrincipalName can start with, used to shard the /users scan
+# (startswith() in Graph filters is case-insensitive)
+_UPN_SHARD_PREFIXES = tuple("abcdefghijklmnopqrstuvwxyz0123456789") + ("'", "-", "_", "!", "#", "^", "~")
+
+# The Management Activity API only keeps content for 7 days
+_CONTENT_RETENTION = timedelta(days=7)
+
+# Blob download retries, matching the requests session Retry policy
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+_MAX_RETRIES = 5
+_BACKOFF_FACTOR = 0.5
+
+# Management Activity API content type carrying CopilotInteraction (RecordType 91)
+# records. There is no Copilot-specific content type, so records are still filtered
+# by RecordType after download
+AUDIT_CONTENT_TYPE = "Audit.General"
+
+# CSV columns, in the order the rows are built
+USER_FIELDNAMES = ("EntraID", "DisplayName", "UserPrincipalName", "JobTitle", "Department",
+                   "City", "Country", "UsageLocation", "ManagerName", "ManagerUPN",
+                   "HasCopilotLicense")
+EVENT_FIELDNAMES = ("TimeStamp", "User", "App", "Location", "App context",
+                    "Accessed Resources", "Accessed Resource Locations",
+                    "Action", "AgentName")
+
+# Copilot app by audit context type
+_APP_MAPPING = {
+    "xlsx": "Excel",
+    "docx": "Word",
+    "pptx": "PowerPoint",
+    "TeamsMeeting": "Teams",
+    "whiteboard": "Whiteboard",
+    "loop": "Loop",
+    "StreamVideo": "Stream"
+}
+
+# Location markers in a context URL, found in a single scan. The trailing "/" is a
+# lookahead so adjacent markers (e.g. a Teams URL followed by /sites/) are all found
+_LOCATION_RE = re.compile(
+    r"(?P<teams>^https://teams\.microsoft\.com(?=/))"
+    r"|(?P<sites>/sites(?=/))"
+    r"|(?P<personal>/personal(?=/))"
+    r"|(?P<channel>ctx=channel)"
+)
+
+# Copilot app by audit app host (applied when the context is not a Teams URL)
+_APP_HOST_MAPPING = {
+    "bizchat": "Copilot for M365 Chat",
+    "Outlook": "Outlook",
+    "Copilot Studio": "Copilot Studio Agent"
+}
+
+
+def _json_loads(content: Union[bytes, str]):
+    """Decode a JSON payload, using orjson when it is installed"""
+    if orjson:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _parse_iso_datetime(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp from the audit APIs, using ciso8601 when it is installed"""
+    if ciso8601:
+        try:
+            return ciso8601.parse_datetime(value)
+        except ValueError:
+            pass
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _get_int_setting(name: str, default: int) -> int:
+    """Read a positive integer setting from the environment, logging and using the default if invalid"""
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    try:
+        parsed = int(value)
+        if parsed > 0:
+            return parsed
+    except ValueError:
+        pass
+    logger.error(f"Invalid {name} value '{value}', using default {default}")
+    return default
+
+
+def _run_async(coro):
+    """Run a coroutine to completion on uvloop when available, else the default loop"""
+    if uvloop and sys.platform != "win32":
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+
+def _retry_delay(response, attempt: int) -> float:
+    """Seconds to wait before retrying, honouring a numeric Retry-After header"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    return _BACKOFF_FACTOR * (2 ** attempt)
+
+
+def _format_timestamp(creation_date: str) -> str:
+    """Convert an ISO 8601 audit timestamp to the dd-MMM-yyyy HH:mm:ss CSV format"""
+    dt = _parse_iso_datetime(creation_date)
+    return f"{dt.day:02d}-{_MONTHS[dt.month - 1]}-{dt.year:04d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+
 
 class CopilotAuditClient:
     """Client for retrieving Microsoft 365 Copilot audit data"""
@@ -72,38 +221,97 @@ class CopilotAuditClient:
         # File paths
         self.users_csv_path = self.output_dir / "Copilot_Users.csv"
         self.events_csv_path = self.output_dir / "Copilot_Events.csv"
+        self.events_checkpoint_path = self.output_dir / ".events_checkpoint"
+        self.processed_blobs_path = self.output_dir / ".processed_blobs"
         self.log_file_path = self.output_dir / "AuditScriptLog.txt"
         
+        # Token cache holds live bearer tokens, so keep it out of the report output directory
+        token_cache_env = os.getenv("MSAL_TOKEN_CACHE_PATH", "")
+        if token_cache_env:
+            self.token_cache_path = Path(token_cache_env).expanduser()
+        else:
+            self.token_cache_path = Path.home() / ".copilot_audit" / "msal_cache.bin"
+        
         # Copilot SKU IDs - load from environment or use default (commercial)
         sku_ids_env = os.getenv("COPILOT_SKU_IDS", "")
         if sku_ids_env:
             self.copilot_sku_ids = [sid.strip() for sid in sku_ids_env.split(",") if sid.strip()]
         else:
             self.copilot_sku_ids = ["639dec6b-bb19-468b-871c-c5c441c4b0cb"]
+        self._copilot_sku_set = frozenset(sid.lower() for sid in self.copilot_sku_ids)
+        
+        # Audit retrieval settings - default lookback 90 days, interval 24 hours
+        self._lookback_days = _get_int_setting("AUDIT_LOOKBACK_DAYS", 90)
+        self._interval_minutes = _get_int_setting("AUDIT_INTERVAL_MINUTES", 1440)
+        
+        # Scan /users as parallel userPrincipalName prefix shards (default: single paged scan)
+        self._sharded_user_scan = os.getenv("GRAPH_SHARDED_USER_SCAN", "false").lower() in ("1", "true", "yes")
+        
+        # Token cache persisted across runs so scheduled executions reuse valid tokens
+        self.token_cache = SerializableTokenCache()
+        if self.token_cache_path.exists():
+            try:
+                self.token_cache.deserialize(self.token_cache_path.read_text(encoding='utf-8'))
+            except Exception as e:
+                logger.warning(f"Could not load token cache: {e}")
+        atexit.register(self._save_token_cache)
         
         # Initialize MSAL app
         self.app = ConfidentialClientApplication(
             client_id=self.client_id,
             client_credential=self.client_secret,
-            authority=f"https://login.microsoftonline.com/{self.tenant_id}"
+            authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+            token_cache=self.token_cache
         )
         
         self.graph_token = None
         self.management_token = None
+        
+        # Shared HTTP session: pooled keep-alive connections and automatic retries
+        # on throttling (429, honouring Retry-After) and transient server errors
+        self.http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET", "POST"]
+            )
+        )
+        self.http.mount("https://graph.microsoft.com", adapter)
+        self.http.mount("https://manage.office.com", adapter)
+    
+    def _save_token_cache(self):
+        """Write the MSAL token cache to disk (owner read/write only) if it changed"""
+        if not self.token_cache.has_state_changed:
+            return
+        
+        try:
+            self.token_cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            fd = os.open(self.token_cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            # O_CREAT only applies the mode to new files; tighten existing ones too
+            if sys.platform != "win32":
+                os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.token_cache.serialize())
+            self.token_cache.has_state_changed = False
+        except Exception as e:
+            logger.warning(f"Could not save token cache: {e}")
     
     def _get_graph_token(self) -> Optional[str]:
         """Get access token for Microsoft Graph API"""
-        if self.graph_token:
-            return self.graph_token
-            
+        # MSAL serves the token from its cache and renews it shortly before it expires
         try:
             result = self.app.acquire_token_for_client(
                 scopes=["https://graph.microsoft.com/.default"]
             )
             
             if "access_token" in result:
-                self.graph_token = result["access_token"]
-                logger.info("Successfully acquired Graph API token")
+                if result["access_token"] != self.graph_token:
+                    self.graph_token = result["access_token"]
+                    logger.info("Successfully acquired Graph API token")
                 return self.graph_token
             else:
                 logger.error(f"Failed to acquire Graph token: {result.get('error_description', 'Unknown error')}")
@@ -114,17 +322,16 @@ class CopilotAuditClient:
     
     def _get_management_token(self) -> Optional[str]:
         """Get access token for Office 365 Management API"""
-        if self.management_token:
-            return self.management_token
-            
+        # MSAL serves the token from its cache and renews it shortly before it expires
         try:
             result = self.app.acquire_token_for_client(
                 scopes=["https://manage.office.com/.default"]
             )
             
             if "access_token" in result:
-                self.management_token = result["access_token"]
-                logger.info("Successfully acquired Management API token")
+                if result["access_token"] != self.management_token:
+                    self.management_token = result["access_token"]
+                    logger.info("Successfully acquired Management API token")
                 return self.management_token
             else:
                 logger.error(f"Failed to acquire Management token: {result.get('error_description', 'Unknown error')}")
@@ -155,10 +362,10 @@ class CopilotAuditClient:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self.http.get(url, headers=headers, params=params)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return _json_loads(response.content)
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.error(f"Graph API request failed for {endpoint}: {e}")
             return None
     
@@ -189,10 +396,10 @@ class CopilotAuditClient:
                 }
                 
                 try:
-                    response = requests.get(next_link, headers=headers)
+                    response = self.http.get(next_link, headers=headers)
                     response.raise_for_status()
-                    data = response.json()
-                except requests.exceptions.RequestException as e:
+                    data = _json_loads(response.content)
+                except (requests.exceptions.RequestException, ValueError) as e:
                     logger.error(f"Error fetching next page: {e}")
                     break
             else:
@@ -209,6 +416,37 @@ class CopilotAuditClient:
         
         return all_items
     
+    def _get_all_users(self, params: Dict) -> List[Dict]:
+        """
+        Get all users matching the query, optionally as parallel prefix-sharded scans
+        
+        Following @odata.nextLink is inherently sequential, so large tenants can split
+        the scan by the first character of userPrincipalName and page each shard
+        concurrently over the shared session.
+        
+        Args:
+            params: Query parameters for the /users endpoint
+            
+        Returns:
+            List of users, deduplicated by ID
+        """
+        if not self._sharded_user_scan:
+            return self._get_all_pages("/users", params)
+        
+        def fetch_shard(prefix: str) -> List[Dict]:
+            escaped_prefix = prefix.replace("'", "''")
+            shard_params = dict(params)
+            shard_params["$filter"] = f"{params['$filter']} and startswith(userPrincipalName,'{escaped_prefix}')"
+            return self._get_all_pages("/users", shard_params)
+        
+        users = {}
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for shard_users in executor.map(fetch_shard, _UPN_SHARD_PREFIXES):
+                for user in shard_users:
+                    users.setdefault(user.get("id"), user)
+        
+        return list(users.values())
+    
     def get_users_with_copilot_license(self) -> bool:
         """
         Retrieve users with job titles and check for Copilot licenses
@@ -224,10 +462,11 @@ class CopilotAuditClient:
             params = {
                 "$filter": "jobTitle ne null",
                 "$select": "id,displayName,userPrincipalName,jobTitle,department,city,country,usageLocation,assignedLicenses",
+                "$expand": "manager($select=displayName,userPrincipalName)",
                 "$top": 999
             }
             
-            users = self._get_all_pages("/users", params)
+            users = self._get_all_users(params)
             logger.info(f"Retrieved {len(users)} users with job titles")
             
             # Process each user
@@ -236,46 +475,36 @@ class CopilotAuditClient:
                 if (i + 1) % 50 == 0:
                     logger.info(f"Processing user {i + 1} of {len(users)}...")
                 
-                user_data = {
-                    "EntraID": user.get("id", ""),
-                    "DisplayName": user.get("displayName", ""),
-                    "UserPrincipalName": user.get("userPrincipalName", ""),
-                    "JobTitle": user.get("jobTitle", ""),
-                    "Department": user.get("department", ""),
-                    "City": user.get("city", ""),
-                    "Country": user.get("country", ""),
-                    "UsageLocation": user.get("usageLocation", ""),
-                    "ManagerName": "",
-                    "ManagerUPN": "",
-                    "HasCopilotLicense": False
-                }
-                
-                # Get manager information
-                try:
-                    manager_data = self._make_graph_request(f"/users/{user['id']}/manager")
-                    if manager_data:
-                        user_data["ManagerName"] = manager_data.get("displayName", "")
-                        user_data["ManagerUPN"] = manager_data.get("userPrincipalName", "")
-                except Exception as e:
-                    logger.debug(f"Could not retrieve manager for user {user.get('userPrincipalName', '')}: {e}")
+                # Manager information is expanded inline with the user
+                manager_data = user.get("manager") or {}
                 
                 # Check for Copilot license
-                assigned_licenses = user.get("assignedLicenses", [])
-                for license in assigned_licenses:
-                    sku_id = str(license.get("skuId", "")).lower()
-                    if sku_id in [sid.lower() for sid in self.copilot_sku_ids]:
-                        user_data["HasCopilotLicense"] = True
-                        break
+                assigned_licenses = user.get("assignedLicenses") or []
+                has_copilot_license = not self._copilot_sku_set.isdisjoint(
+                    str(license.get("skuId", "")).lower() for license in assigned_licenses
+                )
                 
-                results.append(user_data)
+                # Row in USER_FIELDNAMES order
+                results.append((
+                    user.get("id", ""),
+                    user.get("displayName", ""),
+                    user.get("userPrincipalName", ""),
+                    user.get("jobTitle", ""),
+                    user.get("department", ""),
+                    user.get("city", ""),
+                    user.get("country", ""),
+                    user.get("usageLocation", ""),
+                    manager_data.get("displayName", ""),
+                    manager_data.get("userPrincipalName", ""),
+                    has_copilot_license
+                ))
             
             # Write to CSV
             logger.info(f"Writing {len(results)} users to {self.users_csv_path}")
             with open(self.users_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
                 if results:
-                    fieldnames = results[0].keys()
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writeheader()
+                    writer = csv.writer(csvfile)
+                    writer.writerow(USER_FIELDNAMES)
                     writer.writerows(results)
             
             logger.info(f"Successfully exported users to {self.users_csv_path}")
@@ -291,35 +520,184 @@ class CopilotAuditClient:
         with open(self.log_file_path, 'a') as f:
             f.write(f"{timestamp}:{message}\n")
     
+    async def _download_blobs_async(self, blob_uris: List[str], token: str) -> List[Optional[List[Tuple]]]:
+        """
+        Download audit content blobs concurrently and parse their Copilot events
+        
+        Each blob is parsed as soon as it arrives so only event rows, not raw
+        records, are kept in memory.
+        
+        Args:
+            blob_uris: Content URIs returned by the content listing
+            token: Management API access token
+            
+        Returns:
+            Parsed Copilot event rows of each blob in the same order as blob_uris
+            (None if the download failed)
+        """
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        # Keep concurrency below the Management API throttling limits
+        semaphore = asyncio.Semaphore(16)
+        
+        async with httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=32),
+            timeout=httpx.Timeout(60.0)
+        ) as client:
+            async def fetch(uri: str) -> Optional[List[Tuple]]:
+                # Retry throttling (429) and transient errors like the requests session does
+                for attempt in range(_MAX_RETRIES + 1):
+                    response = None
+                    async with semaphore:
+                        try:
+                            response = await client.get(uri, headers=headers)
+                        except httpx.TransportError:
+                            if attempt == _MAX_RETRIES:
+                                raise
+                    if response is not None and (response.status_code not in _RETRY_STATUSES or attempt == _MAX_RETRIES):
+                        break
+                    await asyncio.sleep(_retry_delay(response, attempt))
+                
+                if response.status_code != 200:
+                    logger.warning(f"Content blob request returned status {response.status_code}")
+                    return None
+                return self._parse_copilot_events(_json_loads(response.content))
+            
+            responses = await asyncio.gather(*[fetch(uri) for uri in blob_uris], return_exceptions=True)
+        
+        blobs = []
+        for result in responses:
+            if isinstance(result, Exception):
+                logger.error(f"Error downloading content blob: {result}")
+                blobs.append(None)
+            else:
+                blobs.append(result)
+        return blobs
+    
+    def _read_last_line(self, path: Path, block_size: int = 8192) -> Optional[str]:
+        """
+        Read the last line of a file by scanning backwards from the end
+        
+        Args:
+            path: File to read
+            block_size: Number of bytes read per step
+            
+        Returns:
+            Last non-empty line, or None if the file has fewer than two lines
+        """
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            buf = b""
+            # Stop once a complete line precedes the trailing line terminator
+            while pos > 0 and buf.rstrip(b"\r\n").count(b"\n") < 1:
+                read_size = min(block_size, pos)
+                pos -= read_size
+                f.seek(pos)
+                buf = f.read(read_size) + buf
+        
+        lines = buf.rstrip(b"\r\n").split(b"\n")
+        if len(lines) < 2:
+            return None
+        return lines[-1].rstrip(b"\r").decode('utf-8')
+    
+    def _download_blobs_threaded(self, blob_uris: List[str], token: str) -> List[Optional[List[Tuple]]]:
+        """
+        Download and parse audit content blobs concurrently using the shared requests session
+        
+        Args:
+            blob_uris: Content URIs returned by the content listing
+            token: Management API access token
+            
+        Returns:
+            Parsed Copilot event rows of each blob in the same order as blob_uris
+            (None if the download failed)
+        """
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        
+        def fetch(uri: str) -> Optional[List[Tuple]]:
+            try:
+                response = self.http.get(uri, headers=headers, timeout=60)
+                if response.status_code != 200:
+                    logger.warning(f"Content blob request returned status {response.status_code}")
+                    return None
+                return self._parse_copilot_events(_json_loads(response.content))
+            except Exception as e:
+                logger.error(f"Error downloading content blob: {e}")
+                return None
+        
+        # Socket reads release the GIL, so threads overlap the downloads
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return list(executor.map(fetch, blob_uris))
+    
+    def _download_blobs(self, blob_uris: List[str], token: str) -> List[Optional[List[Tuple]]]:
+        """
+        Download and parse audit content blobs, using httpx when available and threads otherwise
+        
+        Args:
+            blob_uris: Content URIs returned by the content listing
+            token: Management API access token
+            
+        Returns:
+            Parsed Copilot event rows of each blob in the same order as blob_uris
+            (None if the download failed)
+        """
+        if httpx:
+            try:
+                return _run_async(self._download_blobs_async(blob_uris, token))
+            except ImportError as e:
+                logger.warning(f"Async blob download unavailable ({e}), using threads")
+        return self._download_blobs_threaded(blob_uris, token)
+    
+    def _write_events_checkpoint(self, window_end: datetime):
+        """Record the end of the last audit window whose events were fully written"""
+        self.events_checkpoint_path.write_text(window_end.isoformat(), encoding='utf-8')
+    
     def _get_last_event_timestamp(self) -> datetime:
         """
         Get the timestamp of the last event from the CSV file
         
         Returns:
-            Last event timestamp or configured days ago if file doesn't exist
+            End of the last completed window, else last event timestamp,
+            or configured days ago if file doesn't exist
         """
         if not self.events_csv_path.exists():
             # Default lookback period (configurable via environment)
-            lookback_days = int(os.getenv("AUDIT_LOOKBACK_DAYS", "90"))
-            return datetime.utcnow() - timedelta(days=lookback_days)
+            return datetime.utcnow() - timedelta(days=self._lookback_days)
+        
+        # Resume from the end of the last fully written window, if recorded
+        if self.events_checkpoint_path.exists():
+            try:
+                return datetime.fromisoformat(self.events_checkpoint_path.read_text(encoding='utf-8').strip())
+            except ValueError as e:
+                logger.warning(f"Could not parse events checkpoint: {e}")
         
         try:
-            with open(self.events_csv_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                lines = list(reader)
-                if len(lines) > 1:  # More than just header
-                    last_row = lines[-1]
+            last_line = self._read_last_line(self.events_csv_path)
+            if last_line:  # More than just header
+                try:
+                    last_row = next(csv.reader([last_line]))
                     # Extract timestamp from first field (format: dd-MMM-yyyy HH:mm:ss)
-                    timestamp_str = last_row[0]
-                    return datetime.strptime(timestamp_str, '%d-%b-%Y %H:%M:%S')
+                    return datetime.strptime(last_row[0], '%d-%b-%Y %H:%M:%S')
+                except (ValueError, IndexError, StopIteration):
+                    # The last line may be the tail of a quoted multi-line field:
+                    # stream the file with the CSV parser keeping only the last row
+                    with open(self.events_csv_path, 'r', newline='', encoding='utf-8') as f:
+                        last_rows = deque(csv.reader(f), maxlen=1)
+                    return datetime.strptime(last_rows[0][0], '%d-%b-%Y %H:%M:%S')
         except Exception as e:
             logger.warning(f"Could not parse last event timestamp: {e}")
         
         # Default lookback period (configurable via environment)
-        lookback_days = int(os.getenv("AUDIT_LOOKBACK_DAYS", "90"))
-        return datetime.utcnow() - timedelta(days=lookback_days)
+        return datetime.utcnow() - timedelta(days=self._lookback_days)
     
-    def _parse_copilot_event(self, record: Dict) -> Dict:
+    def _parse_copilot_event(self, record: Dict) -> Optional[Tuple]:
         """
         Parse a Copilot interaction audit record
         
@@ -327,34 +705,24 @@ class CopilotAuditClient:
             record: Raw audit record
             
         Returns:
-            Parsed event data
+            Parsed event row in EVENT_FIELDNAMES order, or None on error
         """
         try:
             audit_data = record.get("AuditData", {})
             if isinstance(audit_data, str):
-                audit_data = json.loads(audit_data)
+                audit_data = _json_loads(audit_data)
             
             copilot_event_data = audit_data.get("CopilotEventData", {})
             contexts = copilot_event_data.get("Contexts", [])
             context_type = contexts[0].get("Type", "") if contexts else ""
             context_id = contexts[0].get("Id", "") if contexts else ""
             
-            # Determine Copilot app
-            copilot_app = "Copilot for M365"
-            copilot_location = None
-            
-            # Map context type to app
-            app_mapping = {
-                "xlsx": "Excel",
-                "docx": "Word",
-                "pptx": "PowerPoint",
-                "TeamsMeeting": "Teams",
-                "whiteboard": "Whiteboard",
-                "loop": "Loop",
-                "StreamVideo": "Stream"
-            }
+            # Note: context_id is from Microsoft audit logs, not user input
+            location_markers = {m.lastgroup for m in _LOCATION_RE.finditer(context_id or "")}
             
-            copilot_app = app_mapping.get(context_type, copilot_app)
+            # Determine Copilot app from the context type
+            copilot_app = _APP_MAPPING.get(context_type, "Copilot for M365")
+            copilot_location = None
             
             if context_type == "TeamsMeeting":
                 copilot_location = "Teams meeting"
@@ -363,16 +731,10 @@ class CopilotAuditClient:
             
             # Additional app host checks
             app_host = copilot_event_data.get("AppHost", "")
-            # Note: context_id is from Microsoft audit logs, not user input
-            teams_url_pattern = "https://teams.microsoft.com/"
-            if context_id and context_id.startswith(teams_url_pattern):
+            if "teams" in location_markers:
                 copilot_app = "Teams"
-            elif app_host == "bizchat":
-                copilot_app = "Copilot for M365 Chat"
-            elif app_host == "Outlook":
-                copilot_app = "Outlook"
-            elif app_host == "Copilot Studio":
-                copilot_app = "Copilot Studio Agent"
+            else:
+                copilot_app = _APP_HOST_MAPPING.get(app_host, copilot_app)
             
             # Determine context
             context = context_id or copilot_event_data.get("ThreadId", "")
@@ -388,47 +750,139 @@ class CopilotAuditClient:
                     agent_name = app_identity.split("-")[-1]
             
             # Determine location
-            # Note: context_id is from Microsoft audit logs, not user input
-            if "/sites/" in context_id:
+            if "sites" in location_markers:
                 copilot_location = "SharePoint Online"
-            elif context_id and context_id.startswith("https://teams.microsoft.com/"):
-                if "ctx=channel" in context_id:
+            elif "teams" in location_markers:
+                if "channel" in location_markers:
                     copilot_location = "Teams Channel"
                 else:
                     copilot_location = "Teams Chat"
-            elif "/personal/" in context_id:
+            elif "personal" in location_markers:
                 copilot_location = "OneDrive for Business"
             
             # Extract accessed resources
-            accessed_resources = copilot_event_data.get("AccessedResources", [])
-            resource_names = sorted(set([r.get("Name", "") for r in accessed_resources if r.get("Name")]))
-            resource_ids = sorted(set([r.get("Id", "") for r in accessed_resources if r.get("Id")]))
-            resource_actions = sorted(set([r.get("Action", "") for r in accessed_resources if r.get("Action")]))
+            names, ids, actions = set(), set(), set()
+            for resource in copilot_event_data.get("AccessedResources", []):
+                name = resource.get("Name")
+                if name:
+                    names.add(name)
+                resource_id = resource.get("Id")
+                if resource_id:
+                    ids.add(resource_id)
+                action = resource.get("Action")
+                if action:
+                    actions.add(action)
+            resource_names, resource_ids, resource_actions = sorted(names), sorted(ids), sorted(actions)
             
             # Format timestamp
             creation_date = record.get("CreationTime", record.get("CreationDate", ""))
-            if creation_date:
-                dt = datetime.fromisoformat(creation_date.replace("Z", "+00:00"))
-                timestamp = dt.strftime("%d-%b-%Y %H:%M:%S")
-            else:
-                timestamp = ""
-            
-            return {
-                "TimeStamp": timestamp,
-                "User": record.get("UserId", ""),
-                "App": copilot_app,
-                "Location": copilot_location or "",
-                "App context": context,
-                "Accessed Resources": ", ".join(resource_names),
-                "Accessed Resource Locations": ", ".join(resource_ids),
-                "Action": ", ".join(resource_actions),
-                "AgentName": agent_name
-            }
+            timestamp = _format_timestamp(creation_date) if creation_date else ""
+            
+            return (
+                timestamp,
+                record.get("UserId", ""),
+                copilot_app,
+                copilot_location or "",
+                context,
+                ", ".join(resource_names),
+                ", ".join(resource_ids),
+                ", ".join(resource_actions),
+                agent_name
+            )
             
         except Exception as e:
             logger.error(f"Error parsing event: {e}")
             return None
     
+    def _load_processed_blobs(self) -> Dict[str, datetime]:
+        """
+        Load the content IDs already written to the events CSV by previous runs
+        
+        Entries older than the content retention period can no longer be listed,
+        so they are dropped and the file is rewritten with the remaining ones.
+        
+        Returns:
+            Processing time (UTC) keyed by content ID
+        """
+        processed = {}
+        if not self.processed_blobs_path.exists():
+            return processed
+        
+        cutoff = datetime.utcnow() - _CONTENT_RETENTION
+        try:
+            with open(self.processed_blobs_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    content_id, _, processed_at = line.rstrip("\n").partition("\t")
+                    try:
+                        processed_time = datetime.fromisoformat(processed_at)
+                    except ValueError:
+                        continue
+                    if content_id and processed_time >= cutoff:
+                        processed[content_id] = processed_time
+            
+            with open(self.processed_blobs_path, 'w', encoding='utf-8') as f:
+                for content_id, processed_time in processed.items():
+                    f.write(f"{content_id}\t{processed_time.isoformat()}\n")
+        except OSError as e:
+            logger.warning(f"Could not load processed content blobs: {e}")
+        
+        return processed
+    
+    def _reset_events_state(self):
+        """Remove the checkpoint and processed blob list kept alongside the events CSV"""
+        for path in (self.events_checkpoint_path, self.processed_blobs_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+    
+    def _select_new_blobs(self, content_blobs: List[Dict], processed_blobs: Dict[str, datetime]) -> List[Tuple[str, str]]:
+        """
+        Select the content blobs that still need to be downloaded
+        
+        Blobs whose events were already written, in an earlier window of this run
+        or by a previous run, are skipped.
+        
+        Args:
+            content_blobs: Content listing returned by the Management API
+            processed_blobs: Content IDs already written to the events CSV
+            
+        Returns:
+            Content ID and content URI of each blob to download
+        """
+        selected = []
+        skipped = 0
+        for blob in content_blobs:
+            content_uri = blob.get("contentUri")
+            if not content_uri:
+                continue
+            
+            content_id = blob.get("contentId") or content_uri
+            if content_id in processed_blobs:
+                skipped += 1
+                continue
+            
+            selected.append((content_id, content_uri))
+        
+        if skipped:
+            logger.info(f"Skipping {skipped} already processed content blobs")
+        return selected
+    
+    def _parse_copilot_events(self, records: List[Dict]) -> List[Tuple]:
+        """
+        Filter and parse the Copilot interaction records of a content blob
+        
+        Args:
+            records: Raw audit records of a content blob
+            
+        Returns:
+            Parsed event rows (records that fail to parse are skipped)
+        """
+        parse = self._parse_copilot_event
+        # CopilotInteraction = 91
+        events = [parse(r) for r in records if r.get("RecordType") == 91]
+        return [e for e in events if e]
+    
     def get_copilot_events(self) -> bool:
         """
         Retrieve Copilot interaction events from audit logs using Office 365 Management API
@@ -443,6 +897,13 @@ class CopilotAuditClient:
             start_date = self._get_last_event_timestamp()
             end_date = datetime.utcnow()
             
+            # Content older than the retention period can no longer be listed; keep a
+            # small margin so the first window is not rejected while the run starts
+            earliest_start = end_date - _CONTENT_RETENTION + timedelta(minutes=5)
+            if start_date < earliest_start:
+                logger.info(f"Start {start_date} is older than the {_CONTENT_RETENTION.days}-day content retention, starting from {earliest_start}")
+                start_date = earliest_start
+            
             logger.info(f"Retrieving audit records between {start_date} and {end_date}")
             self._write_log_file(f"BEGIN: Retrieving audit records between {start_date} and {end_date}")
             
@@ -460,8 +921,8 @@ class CopilotAuditClient:
             
             # Start subscription (if not already started)
             try:
-                subscription_url = f"{base_url}/subscriptions/start?contentType=Audit.General&PublisherIdentifier={self.tenant_id}"
-                response = requests.post(subscription_url, headers=headers)
+                subscription_url = f"{base_url}/subscriptions/start?contentType={AUDIT_CONTENT_TYPE}&PublisherIdentifier={self.tenant_id}"
+                response = self.http.post(subscription_url, headers=headers)
                 if response.status_code in [200, 400]:  # 400 if already subscribed
                     logger.info("Audit subscription active")
             except Exception as e:
@@ -471,88 +932,102 @@ class CopilotAuditClient:
             # Note: The Management API works differently than Search-UnifiedAuditLog
             # We need to list content blobs and download them
             total_count = 0
-            # Configurable interval minutes (default 24 hours)
-            interval_minutes = int(os.getenv("AUDIT_INTERVAL_MINUTES", "1440"))
             current_start = start_date
+            # The checkpoint stays at the first window with errors so the next run retries it;
+            # later windows are still retrieved and .processed_blobs prevents re-appending them
+            all_windows_complete = True
+            # Check if file exists to determine if we should write the header
+            file_exists = self.events_csv_path.exists()
             
-            results = []
+            # Content IDs whose events are already in the CSV. The sidecar files only
+            # describe an existing CSV, so discard them when the CSV is rebuilt
+            if file_exists:
+                processed_blobs = self._load_processed_blobs()
+            else:
+                self._reset_events_state()
+                processed_blobs = {}
             
-            while current_start < end_date:
-                current_end = min(current_start + timedelta(minutes=interval_minutes), end_date)
-                
-                logger.info(f"Retrieving audit records for activities between {current_start} and {current_end}")
-                self._write_log_file(f"INFO: Retrieving audit records for activities between {current_start} and {current_end}")
-                
-                # List available content
-                start_time_str = current_start.strftime("%Y-%m-%dT%H:%M:%S")
-                end_time_str = current_end.strftime("%Y-%m-%dT%H:%M:%S")
+            # Events are appended per blob; only parsed Copilot rows of one window are held in memory
+            with open(self.events_csv_path, 'a', newline='', encoding='utf-8') as csvfile, \
+                    open(self.processed_blobs_path, 'a', encoding='utf-8') as processed_file:
+                writer = csv.writer(csvfile)
                 
-                list_url = f"{base_url}/subscriptions/content?contentType=Audit.General&startTime={start_time_str}&endTime={end_time_str}&PublisherIdentifier={self.tenant_id}"
+                if not file_exists:
+                    writer.writerow(EVENT_FIELDNAMES)
                 
-                try:
-                    response = requests.get(list_url, headers=headers)
+                while current_start < end_date:
+                    current_end = min(current_start + timedelta(minutes=self._interval_minutes), end_date)
+                    window_complete = True
+                    
+                    # Long runs can outlive a single access token
+                    token = self._get_management_token() or token
+                    headers["Authorization"] = f"Bearer {token}"
+                    
+                    logger.info(f"Retrieving audit records for activities between {current_start} and {current_end}")
+                    self._write_log_file(f"INFO: Retrieving audit records for activities between {current_start} and {current_end}")
                     
-                    if response.status_code == 200:
-                        content_blobs = response.json()
-                        logger.info(f"Found {len(content_blobs)} content blobs")
+                    # List available content
+                    start_time_str = current_start.strftime("%Y-%m-%dT%H:%M:%S")
+                    end_time_str = current_end.strftime("%Y-%m-%dT%H:%M:%S")
+                    
+                    list_url = f"{base_url}/subscriptions/content?contentType={AUDIT_CONTENT_TYPE}&startTime={start_time_str}&endTime={end_time_str}&PublisherIdentifier={self.tenant_id}"
+                    
+                    try:
+                        response = self.http.get(list_url, headers=headers)
                         
-                        # Download each content blob
-                        for blob in content_blobs:
-                            content_uri = blob.get("contentUri")
-                            if not content_uri:
-                                continue
+                        if response.status_code == 200:
+                            content_blobs = _json_loads(response.content)
+                            logger.info(f"Found {len(content_blobs)} content blobs")
                             
-                            try:
-                                content_response = requests.get(content_uri, headers=headers)
-                                if content_response.status_code == 200:
-                                    records = content_response.json()
-                                    
-                                    # Filter for CopilotInteraction records
-                                    copilot_records = [r for r in records if r.get("RecordType") == 91]  # CopilotInteraction = 91
-                                    
-                                    logger.info(f"Found {len(copilot_records)} Copilot records in blob")
-                                    
-                                    for record in copilot_records:
-                                        parsed_event = self._parse_copilot_event(record)
-                                        if parsed_event:
-                                            results.append(parsed_event)
-                                            total_count += 1
-                                    
-                            except Exception as e:
-                                logger.error(f"Error downloading content blob: {e}")
-                    
-                    elif response.status_code == 204:
-                        logger.info("No content available for this time range")
-                    else:
-                        logger.warning(f"List content request returned status {response.status_code}")
+                            new_blobs = self._select_new_blobs(content_blobs, processed_blobs)
+                            
+                            # Download all content blobs concurrently
+                            blobs = self._download_blobs([uri for _, uri in new_blobs], token)
+                            
+                            for (content_id, _), events in zip(new_blobs, blobs):
+                                if events is None:
+                                    window_complete = False
+                                    continue
+                                
+                                logger.info(f"Found {len(events)} Copilot records in blob")
+                                
+                                if events:
+                                    writer.writerows(events)
+                                    csvfile.flush()
+                                    total_count += len(events)
+                                
+                                # Record the blob only once its events are on disk
+                                processed_time = datetime.utcnow()
+                                processed_file.write(f"{content_id}\t{processed_time.isoformat()}\n")
+                                processed_file.flush()
+                                processed_blobs[content_id] = processed_time
                         
-                except Exception as e:
-                    logger.error(f"Error listing content: {e}")
-                
-                current_start = current_end
-            
-            # Write results to CSV
-            if results:
-                logger.info(f"Writing {len(results)} events to {self.events_csv_path}")
-                
-                # Check if file exists to determine if we should append
-                file_exists = self.events_csv_path.exists()
-                mode = 'a' if file_exists else 'w'
-                
-                with open(self.events_csv_path, mode, newline='', encoding='utf-8') as csvfile:
-                    fieldnames = ["TimeStamp", "User", "App", "Location", "App context", 
-                                  "Accessed Resources", "Accessed Resource Locations", 
-                                  "Action", "AgentName"]
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                        elif response.status_code == 204:
+                            logger.info("No content available for this time range")
+                        elif response.status_code == 400 and current_start < datetime.utcnow() - _CONTENT_RETENTION:
+                            logger.info("Time range is beyond the content retention period, skipping")
+                        else:
+                            logger.warning(f"List content request returned status {response.status_code}")
+                            window_complete = False
+                            
+                    except Exception as e:
+                        logger.error(f"Error listing content: {e}")
+                        window_complete = False
                     
-                    if not file_exists:
-                        writer.writeheader()
+                    if not window_complete:
+                        if all_windows_complete:
+                            logger.error(f"Incomplete window; the next run resumes from {current_start}")
+                        all_windows_complete = False
+                    elif all_windows_complete:
+                        self._write_events_checkpoint(current_end)
                     
-                    writer.writerows(results)
+                    current_start = current_end
             
             self._write_log_file(f"END: Retrieved {total_count} audit records")
-            logger.info(f"Successfully retrieved {total_count} Copilot events")
+            if not all_windows_complete:
+                return False
             
+            logger.info(f"Successfully retrieved {total_count} Copilot events")
             return True
             
         except Exception as e: